@@ -1,19 +1,23 @@
-import time
 import os
-import base64
-import requests
+import io
+import pybase64
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from PIL import Image
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAioHttpClient
 from selenium import webdriver
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException, TimeoutException, StaleElementReferenceException
 from selenium.webdriver.support.ui import WebDriverWait, Select
+from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
 import json
 import logging
 import pandas as pd
+import numpy as np
 
 # Logging setup function
 def setup_logging():
@@ -39,6 +43,28 @@ def setup_logging():
 # Load API key from environment variable
 api_key = os.environ.get('API_survey')
 
+# Cache of async OpenAI clients keyed by API key, shared by all concurrent survey tasks
+_clients: dict[str, AsyncOpenAI] = {}
+
+def _get_client(key: str) -> AsyncOpenAI:
+    """
+    Returns the cached async OpenAI client for the given API key, creating it on first use.
+    The client is created lazily so its aiohttp session is bound to the running event loop.
+    """
+    if key not in _clients:
+        _clients[key] = AsyncOpenAI(api_key=key, http_client=DefaultAioHttpClient())  # aiohttp transport, one session for all requests
+    return _clients[key]
+
+# Maximum number of users processed concurrently (keep within the account's RPM/TPM limits)
+MAX_CONCURRENT_USERS = 8
+
+# JPEG quality and scale of the page screenshots sent to the vision model (smaller upload, fewer image tokens)
+SCREENSHOT_JPEG_QUALITY = 70
+SCREENSHOT_SCALE = 0.5
+
+# Number of most recent messages (answer summaries) kept after the system message when calling the API
+MESSAGE_HISTORY_LENGTH = 8
+
 # Set up logging
 logger = setup_logging()
 
@@ -47,24 +73,59 @@ data = pd.read_csv('user_data.csv', delimiter=';')  # Load data into a pandas Da
 logger.info(f"Data loaded from CSV file")  # Log successful data load
 logger.info(data.head())  # Display first few rows of the data for verification
 
-# Function to capture screenshots while scrolling the page
-def take_screenshots_scroll(driver: webdriver.Chrome, filepath: str = 'screenshots/screenshot') -> List[str]:
+# Function to capture the full page in a single screenshot using the Chrome DevTools Protocol
+def take_screenshot_full_page(driver: webdriver.Chrome) -> str:
+    """
+    Captures the entire scrollable page with one CDP call and returns the base64 encoded JPEG image.
+    """
+    layout_metrics = driver.execute_cdp_cmd("Page.getLayoutMetrics", {})
+    content_size = layout_metrics.get("cssContentSize") or layout_metrics["contentSize"]  # Size of the whole page (older Chrome only reports contentSize)
+    screenshot = driver.execute_cdp_cmd("Page.captureScreenshot", {
+        "format": "jpeg",
+        "quality": SCREENSHOT_JPEG_QUALITY,
+        "captureBeyondViewport": True,
+        "clip": {"x": 0, "y": 0, "width": content_size["width"], "height": content_size["height"], "scale": SCREENSHOT_SCALE}
+    })
+    logger.info(f"Full page screenshot captured")
+    return screenshot["data"]  # Already base64 encoded by Chrome
+
+# Function to wait until a scroll has completed
+def wait_for_scroll(driver: webdriver.Chrome, timeout: float = 5) -> float:
     """
-    Takes screenshots while scrolling through the webpage and returns the list of screenshot file paths.
+    Waits until the page has finished loading and the scroll position is the same on two consecutive polls,
+    and returns that scroll position. If the page does not settle within the timeout, a warning is logged
+    and the last scroll position seen is returned.
     """
-    screenshots = []  # List to hold screenshot file paths
+    last_offset = [None]  # Scroll position seen on the previous poll
+
+    def scroll_settled(d):
+        offset = d.execute_script("return document.readyState === 'complete' ? window.pageYOffset : null")
+        settled = offset is not None and offset == last_offset[0]
+        last_offset[0] = offset
+        return settled
+
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.05).until(scroll_settled)
+    except TimeoutException:
+        logger.warning(f"Scroll did not settle within {timeout} seconds, taking the screenshot anyway")
+        if last_offset[0] is None:  # readyState never reached complete, read the position directly
+            return driver.execute_script("return window.pageYOffset")
+    return last_offset[0]
+
+# Function to capture screenshots while scrolling the page (fallback when CDP is unavailable)
+def take_screenshots_scroll(driver: webdriver.Chrome) -> List[Image.Image]:
+    """
+    Takes screenshots while scrolling through the webpage and returns them as in-memory images.
+    """
+    screenshots = []  # List to hold screenshot images
     last_height = 0  # Initialize last scroll position
 
     while True:
-        filename = f'{filepath}_{len(screenshots)}.png'  # Filename for each screenshot
-        driver.save_screenshot(filename)  # Capture screenshot
-        screenshots.append(filename)  # Add filename to list
-        logger.info(f"Screenshot saved: {filename}")
+        screenshots.append(Image.open(io.BytesIO(driver.get_screenshot_as_png())))  # Capture screenshot without writing it to disk
+        logger.info(f"Screenshot captured: {len(screenshots)}")
 
         driver.execute_script("window.scrollBy(0, window.innerHeight);")  # Scroll the page
-        time.sleep(2)  # Wait for scroll to complete
-
-        new_height = driver.execute_script("return window.pageYOffset")  # Get new scroll position
+        new_height = wait_for_scroll(driver)  # Wait for scroll to complete and get new scroll position
         if new_height == last_height:  # Stop if scroll position hasn't changed
             break
         last_height = new_height
@@ -72,95 +133,215 @@ def take_screenshots_scroll(driver: webdriver.Chrome, filepath: str = 'screensho
     return screenshots
 
 # Function to stitch images vertically into one image
-def stitch_images_vertically(images: List[str], output_filename: str = 'stitched.png'):
+def stitch_images_vertically(imgs: List[Image.Image]) -> Image.Image:
     """
-    Stitches the provided images vertically and saves the resulting image.
+    Stitches the provided images vertically and returns the resulting image.
     """
-    imgs = [Image.open(x) for x in images]  # Load images
     widths, heights = zip(*(i.size for i in imgs))  # Get dimensions of images
 
     total_height = sum(heights)  # Calculate total height of the stitched image
     max_width = max(widths)  # Calculate max width of the images
-    stitched_image = Image.new('RGB', (max_width, total_height))  # Create a blank image canvas
+    canvas = np.zeros((total_height, max_width, 3), dtype=np.uint8)  # Preallocate a blank RGB canvas
 
     y_offset = 0  # Initialize vertical offset
     for img in imgs:
-        stitched_image.paste(img, (0, y_offset))  # Paste each image in order
+        canvas[y_offset:y_offset + img.height, :img.width] = np.asarray(img.convert('RGB'))  # Place each image in order
         y_offset += img.height  # Update offset for next image
+        img.close()  # Release the decoded tile as soon as it has been copied
 
-    stitched_image.save(output_filename)  # Save stitched image
-    logger.info(f"Stitched image saved: {output_filename}")
+    logger.info(f"Screenshots stitched")
+    return Image.fromarray(canvas)
 
-# Function to encode an image to base64
-def encode_image(image_path: str) -> str:
+# Function to compress an image before sending it to the API
+def compress_image(image: Image.Image) -> bytes:
+    """
+    Downscales the image and returns it encoded as JPEG bytes.
+    """
+    width, height = image.size
+    image = image.resize((int(width * SCREENSHOT_SCALE), int(height * SCREENSHOT_SCALE)))  # Downscale the image
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=SCREENSHOT_JPEG_QUALITY, optimize=True)  # Encode as JPEG instead of PNG
+    return buffer.getvalue()
+
+# Function to encode an image to base64 (only needed for stitched screenshots, CDP screenshots are already base64)
+def encode_image(image_bytes: bytes) -> str:
     """
-    Encodes the image at the given path to a base64 string.
+    Encodes the given image bytes to a base64 string.
     """
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')  # Return base64 encoded image
+    return pybase64.b64encode(image_bytes).decode('ascii')  # Return base64 encoded image (SIMD accelerated)
 
-# Function to handle answering multiple-choice questions via API
-def answer_survey_choice(api_key: str, messages) -> int:
+# Function to read a question index or choice number from the API reply
+def _parse_number(value):
+    """
+    Returns the value as an int if it is an int or a string of digits, otherwise None.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+# Function to check that an answer from the API can be entered for its question
+def _answer_usable(question: tuple, item) -> bool:
+    """
+    Returns True if the entry has an answer and a summary and the answer fits the question type.
+    """
+    if not isinstance(item, dict) or "answer" not in item or "summary" not in item:
+        return False
+    question_type, _, _, buttons = question
+    answer = item["answer"]
+    match question_type:
+        case "cbc_task":  # Choice number must point to one of the answer buttons
+            choice = _parse_number(answer)
+            return choice is not None and 1 <= choice <= len(buttons)
+        case "textarea":
+            return isinstance(answer, str)
+        case _:
+            return isinstance(answer, (str, int, float)) and not isinstance(answer, bool)
+
+# Function to answer all questions on a survey page in a single API call
+async def answer_survey_page(messages, questions: list) -> dict:
     """
-    Sends the survey question to the OpenAI API and returns a choice number (int) for multiple-choice questions.
+    Sends all survey questions of a page to the OpenAI API and returns a dict mapping each
+    question index to its answer and summary. An invalid reply is retried once before a ValueError is raised.
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
+    for attempt in range(2):
+        response = await _get_client(api_key).chat.completions.create(
+            model="gpt-4o",  # GPT-4 model used for responses
+            messages=messages,
+            top_p=0.5,
+            temperature=0.5,
+            response_format={"type": "json_object"}  # Answers and summaries returned together as JSON
+        )
+        reply = response.choices[0].message.content
+        try:
+            items = json.loads(reply)["answers"]
+        except (ValueError, KeyError, TypeError):
+            items = None
+
+        # Every question on the page must have exactly one entry with a usable answer and a summary
+        if isinstance(items, list) and len(items) == len(questions):
+            answers = {
+                _parse_number(item.get("idx")): item
+                for item in items if isinstance(item, dict)
+            }  # Index answers by question number
+            if set(answers) == set(range(len(questions))) and all(
+                _answer_usable(question, answers[i]) for i, question in enumerate(questions)
+            ):
+                return answers
+        logger.warning(f"Invalid answers returned by the API (attempt {attempt + 1}): {reply}")
+
+    raise ValueError(f"API did not return a valid answer for each of the {len(questions)} questions on the page")
+
+# Function to capture a survey page and collect the questions on it
+def read_survey_page(driver: webdriver.Chrome) -> tuple[str, list]:
+    """
+    Captures the current survey page and returns the base64 encoded screenshot together with the
+    (type, element, html, answer buttons) of each question on the page, sorted by position.
+    """
+    try:
+        base64_image = take_screenshot_full_page(driver)  # Capture the whole survey page in one shot
+    except (WebDriverException, KeyError):
+        logger.warning(f"Full page screenshot not available, falling back to scrolling screenshots")
+        screenshots = take_screenshots_scroll(driver)  # Take scrolling screenshots of the survey page
+        stitched_image = stitch_images_vertically(screenshots)  # Stitch screenshots into one image
+        base64_image = encode_image(compress_image(stitched_image))  # Encode the stitched screenshot into base64
+        logger.info(f"Image encoded to base64")
+
+    # Gather all questions on the page by finding elements by their respective classes and tags,
+    # tagging each element with its question type so it does not need to be looked up again
+    all_questions = (
+        [("cbc_task", e) for e in driver.find_elements(By.CLASS_NAME, "cbc_task")] +
+        [("select", e) for e in driver.find_elements(By.TAG_NAME, 'select')] +
+        [("question numeric", e) for e in driver.find_elements(By.CLASS_NAME, "question.numeric")] +
+        [("response_column", e) for e in driver.find_elements(By.CLASS_NAME, "response_column")] +
+        [("textarea", e) for e in driver.find_elements(By.TAG_NAME, 'textarea')]
+    )
+    logger.debug(f"{all_questions}")
 
-    payload = {
-        "model": "gpt-4o",  # GPT-4 model used for responses
-        "messages": messages,
-        "top_p": 0.5,
-        "temperature": 0.5
-    }
+    # Get the page position, html and answer buttons of all questions in a single script call instead of several calls per element
+    page_info = driver.execute_script(
+        "return arguments[0].map(e => {const r = e.getBoundingClientRect(); "
+        "return [r.top + window.scrollY, r.left + window.scrollX, e.outerHTML, Array.from(e.getElementsByClassName('task_select_button'))];});",
+        [element for _, element in all_questions]
+    )
+    questions = [
+        (question_type, element, html_question, buttons)
+        for (_, _, html_question, buttons), (question_type, element)
+        in sorted(zip(page_info, all_questions), key=lambda pair: pair[0][:2])  # Sort questions based on their position on the page
+    ]
+    logger.info(f"Total questions found: {len(questions)}")
 
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-    return int(response.json()["choices"][0]["message"]["content"])  # Return choice as integer
+    return base64_image, questions
 
-# Function to handle answering open-ended questions via API
-def answer_survey_other(api_key: str, messages) -> str:
+# Function to wait until the page has finished reacting to an input
+def wait_for_page_settled(driver: webdriver.Chrome, timeout: float = 1):
     """
-    Sends the survey question to the OpenAI API and returns a text response for open-ended questions.
+    Waits until the page has finished loading and has no pending jQuery requests.
+    If the page does not settle within the timeout, a warning is logged and the caller continues.
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.05, ignored_exceptions=(StaleElementReferenceException,)).until(
+            lambda d: d.execute_script("return document.readyState === 'complete' && (!window.jQuery || window.jQuery.active === 0)")
+        )
+    except TimeoutException:
+        logger.warning(f"Page did not settle within {timeout} seconds, continuing anyway")
 
-    payload = {
-        "model": "gpt-4o",  # GPT-4 model used for responses
-        "messages": messages,
-        "top_p": 0.5,
-        "temperature": 0.5
-    }
+# Function to fill in the answers of a survey page in the browser
+def fill_answers(driver: webdriver.Chrome, questions: list, answers: dict):
+    """
+    Enters the answer to each question of the page in the browser.
+    """
+    for i, (question_type, element, _, buttons) in enumerate(questions):
+        answer = answers[i]["answer"]
+        match question_type:
+            case "cbc_task":  # Multiple choice task
+                buttons[_parse_number(answer) - 1].click()  # Click the chosen answer in the browser
+                logger.info(f"Answer selected in chrome browser")
+            case "select":
+                select = Select(element)  # Select the dropdown option in the browser
+                select.select_by_value(str(answer))
+                logger.info(f"Answer selected in chrome browser")
+            case "question numeric":
+                element.find_element(By.TAG_NAME, "input").send_keys(str(answer))  # Enter the answer into the input field in the browser
+                logger.info(f"Answer inputted in chrome browser")
+            case "response_column":  # Likely used for multi-select or matrix questions
+                element.click()  # Select the answer in the browser
+                logger.info(f"Answer selected in chrome browser")
+            case "textarea":  # Open text responses
+                element.send_keys(str(answer))  # Enter the text response into the text area
+                logger.info(f"Answer inputted in chrome browser")
 
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-    return response.json()["choices"][0]["message"]["content"]  # Return the text content
+        # Wait for the page to react to the answer before answering the next question
+        if i + 1 < len(questions):
+            wait_for_page_settled(driver)
 
-# Function to summarize survey answers using OpenAI API
-def summarize_answer(api_key, html_question, answer):
+# Function to move to the next survey page
+def go_to_next_page(wait: WebDriverWait) -> bool:
     """
-    Summarizes the provided answer to the survey question using the OpenAI API.
+    Clicks the "Next" button and returns False if it could not be found.
     """
-    client = OpenAI(api_key=api_key)  # Initialize OpenAI client
+    try:
+        next_button = wait.until(EC.element_to_be_clickable((By.ID, "next_button")))
+        next_button.click()
+    except WebDriverException:
+        return False
+    return True
 
-    response = client.chat.completions.create(
-      model="gpt-4o-mini",
-      messages=[
-        {"role": "system", "content": "You are a helpful assistant that summarizes the answer given to a survey question. \
-          You will be given the html code of the question and the answer given by the respondent. You have to summarize the answer."},
-        {"role": "user", "content": f"{html_question} \n\n I answered this question with the following answer: {answer}"},
-      ]
-    )
-    logger.info(f"Answer summary: {response.choices[0].message.content}")
-    return response.choices[0].message.content  # Return summarized answer
+# Function to write messages to a user's message log
+def write_message_log(log_filename: str, messages: list, mode: str = 'a'):
+    """
+    Writes the given messages to the log file, one JSON object per line.
+    """
+    with open(log_filename, mode) as f:
+        for message in messages:
+            f.write(json.dumps(message) + "\n")
 
 # Main function to fill the survey for a given user
-def fill_survey(driver: webdriver.Chrome, age, gender, Country_origin, ethnicity, Country, student_text, work_status):
+async def fill_survey(driver: webdriver.Chrome, user_id, age, gender, Country_origin, ethnicity, Country, student_text, work_status) -> bool:
     """
     Automates the process of filling out a survey for a user based on their profile and OpenAI-generated responses.
+    Returns False if the survey had to be stopped because no valid answers were returned for a page.
     """
     page_index = 0  # Track the survey page
     logger.info(f"Starting survey for user with: age {age}, gender {gender}, country of origin {Country_origin}, ethnicity {ethnicity}, country {Country}, student status {student_text}, work status {work_status}")
@@ -170,7 +351,7 @@ def fill_survey(driver: webdriver.Chrome, age, gender, Country_origin, ethnicity
             {
                 "role": "system",
                 "content": (
-                    f"You are answering a survey. You will be given html code of the question. \
+                    f"You are answering a survey. You will be given a numbered list with the html code of the questions on a page. \
                     You have to answer the question as if you are a {age} year old {gender} \
                     born in {Country_origin} with ethnicity {ethnicity} who lives in {Country}, Nordrhein-Westfalen. \
                     {student_text} and your work status is: {work_status}. So: \
@@ -182,56 +363,37 @@ def fill_survey(driver: webdriver.Chrome, age, gender, Country_origin, ethnicity
                     - Country: {Country} \
                     - Student: {student_text} \
                     - Work status: {work_status} \
-                    Only return your answer and nothing else.\
-                    IF it is a multuple choise question, Only return the number of the answer you choose, like '1', '2', '3' or '4', etc.\
-                    IF it is a text question, return the text you would write as a response.\
-                    ONLY return the answer.\
-                    ONLY return the answer on the html question provided.\
-                    DO NOT answer any other questions that are in the screenshot, ONLY the html question provided."
+                    Return JSON in the form {{\"answers\": [{{\"idx\": ..., \"answer\": ..., \"summary\": ...}}, ...]}} and nothing else, \
+                    with one entry per question where idx is the number of the question in the list.\
+                    IF it is a multuple choise question, the answer is Only the number of the answer you choose, like 1, 2, 3 or 4, etc.\
+                    IF it is a text question, the answer is the text you would write as a response.\
+                    The summary is a short summary of the question and the answer you gave to it.\
+                    ONLY answer the html questions provided.\
+                    DO NOT answer any other questions that are in the screenshot, ONLY the html questions provided."
                 )
             }
       ]
 
+    wait = WebDriverWait(driver, 10, poll_frequency=0.25)  # Reused for the "Next" button on every page
+
+    # Start this user's message log with the system message, later pages only append to it
+    log_filename = f'messages_{user_id}.jsonl'
+    await asyncio.to_thread(write_message_log, log_filename, messages[:1], 'w')
+
     # Loop through survey pages and answer questions
+    # Browser work runs in a worker thread so the other users' browsers keep working in parallel
     while True:
-      content = []
-      screenshots = take_screenshots_scroll(driver)  # Take scrolling screenshots of the survey page
-      output_filename = f'stitched/survey_screenshot_{page_index}.png'
-      stitch_images_vertically(screenshots, output_filename)  # Stitch screenshots into one image
-
-      # Gather all questions on the page by finding elements by their respective classes and tags
-      all_questions = (
-          driver.find_elements(By.CLASS_NAME, "cbc_task") +
-          driver.find_elements(By.TAG_NAME, 'select') +
-          driver.find_elements(By.CLASS_NAME, "question.numeric") +
-          driver.find_elements(By.CLASS_NAME, "response_column") +
-          driver.find_elements(By.TAG_NAME, 'textarea')
-      )
-
-      print(f"{all_questions}")
-
-      base64_image = encode_image(output_filename)  # Encode the stitched image into base64
-      logger.info(f"Image encoded to base64")
-      content.append({
+      page_start = len(messages)  # Messages added from here on belong to this page
+      base64_image, questions = await asyncio.to_thread(read_survey_page, driver)
+      content = [{
                     "type": "image_url",
                     "image_url": {
                         "url": f"data:image/jpeg;base64,{base64_image}"
                     }
-                    })
+                    }]
       logger.info(f"Screenshot added to API messages")
 
-      def get_position(element):
-          """
-          Helper function to get the screen position of an element.
-          """
-          location = element.location
-          return location['y'], location['x']
-
-      sorted_elements = sorted(all_questions, key=get_position)  # Sort questions based on their position on the page
-      total_questions = len(all_questions)  # Count number of questions
-      logger.info(f"Total questions found: {total_questions}")
-
-      if total_questions == 0:
+      if len(questions) == 0:
             # If no questions (e.g., an introductory page), just add the screenshot to messages
             messages.append({
                 "role": "user",
@@ -240,184 +402,78 @@ def fill_survey(driver: webdriver.Chrome, age, gender, Country_origin, ethnicity
             logger.info(f"Screenshot added to messages, no questions found, moving to next page")
 
       else:
-        # Loop through each question found on the page
-        for i in range(total_questions):
-            element = sorted_elements[i]
-            logger.debug(f"Element: {element}")
-
-            # Check for specific question types and answer accordingly
-            if element in driver.find_elements(By.CLASS_NAME, "cbc_task"):
-                logger.info(f"Question type: cbc_task")  # Multiple choice task
-                html_question = element.get_attribute('innerHTML')
-                logger.debug(f"HTML question: {html_question}")
-                content.append({
-                    "type": "text",
-                    "text": f"{html_question} \n\n Answer this question as if you were the respondent. Only return your answer."
-                  })
-                messages.append({
-                    "role": "user",
-                    "content": content
-                })
-                logger.info(f"HTML question added to messages")
-                logger.debug(f"Messages before: {messages}")
-                answer = answer_survey_choice(api_key, messages)  # Get answer from OpenAI API
-                logger.info(f"Answer: {answer}")
-                messages = messages[:-1]  # Remove the question from the messages
-                logger.info(f"Removing html question from message thread")
-                logger.info(f"Messages after: {messages}")
-                content = []  # Reset content list
-                answer_summary = summarize_answer(api_key, html_question, answer)  # Summarize the answer
-                messages.append({
-                    "role": "assistant",
-                    "content": f"{answer_summary}"
-                })
-                logger.info(f"Answer summary added to message thread")
-                element.find_elements(By.CLASS_NAME, "task_select_button")[answer - 1].click()  # Click the chosen answer in the browser
-                logger.info(f"Answer selected in chrome browser")
-                time.sleep(1)
-
-            # Handle select dropdowns
-            elif element in driver.find_elements(By.TAG_NAME, 'select'):
-                logger.info(f"Question type: select")
-                html_question = element.get_attribute('outerHTML')
-                logger.debug(f"HTML question: {html_question}")
-                content.append({
-                    "type": "text",
-                    "text": f"{html_question} \n\n Answer this question as if you were the respondent. Only return your answer."
-                })
-                messages.append({
-                    "role": "user",
-                    "content": content
-                })
-                logger.info(f"HTML question added to messages")
-                logger.debug(f"Messages: {messages}")
-                answer = answer_survey_choice(api_key, messages)  # Get answer from OpenAI API
-                logger.info(f"Answer: {answer}")
-                messages = messages[:-1]  # Remove the question from the messages
-                logger.info(f"Removing html question from message thread")
-                content = []  # Reset content list
-                answer_summary = summarize_answer(api_key, html_question, answer)  # Summarize the answer
-                messages.append({
-                    "role": "assistant",
-                    "content": f"{answer_summary}"
-                })
-                logger.info(f"Answer summary added to message thread")
-                select = Select(element)  # Select the dropdown option in the browser
-                select.select_by_value(str(answer))
-                logger.info(f"Answer selected in chrome browser")
-                time.sleep(1)
-
-            # Handle numeric input fields
-            elif element in driver.find_elements(By.CLASS_NAME, "question.numeric"):
-                logger.info(f"Question type: question numeric")
-                html_question = element.get_attribute('outerHTML')
-                logger.debug(f"HTML question: {html_question}")
-                content.append({
-                    "type": "text",
-                    "text": f"{html_question} \n\n Answer this question as if you were the respondent. Only return your answer."
-                })
-                messages.append({
-                    "role": "user",
-                    "content": content
-                })
-                logger.info(f"HTML question added to messages")
-                logger.debug(f"Messages: {messages}")
-                answer = answer_survey_other(api_key, messages)  # Get answer from OpenAI API
-                logger.info(f"Answer: {answer}")
-                messages = messages[:-1]  # Remove the question from the messages
-                logger.info(f"Removing html question from message thread")
-                content = []  # Reset content list
-                answer_summary = summarize_answer(api_key, html_question, answer)  # Summarize the answer
-                messages.append({
-                    "role": "assistant",
-                    "content": f"{answer_summary}"
-                })
-                logger.info(f"Answer summary added to message thread")
-                element.find_element(By.TAG_NAME, "input").send_keys(answer)  # Enter the answer into the input field in the browser
-                logger.info(f"Answer inputted in chrome browser")
-                time.sleep(1)
-
-            # Handle response columns (likely used for multi-select or matrix questions)
-            elif element in driver.find_elements(By.CLASS_NAME, "response_column"):
-                logger.info(f"Question type: response_column")
-                html_question = element.get_attribute('innerHTML')
-                logger.debug(f"HTML question: {html_question}")
-                content.append({
-                    "type": "text",
-                    "text": f"{html_question} \n\n Answer this question as if you were the respondent. Only return your answer."
-                })
-                messages.append({
-                    "role": "user",
-                    "content": content
-                })
-                logger.info(f"HTML question added to messages")
-                logger.debug(f"Messages: {messages}")
-                answer = answer_survey_choice(api_key, messages)  # Get answer from OpenAI API
-                logger.info(f"Answer: {answer}")
-                messages = messages[:-1]  # Remove the question from the messages
-                logger.info(f"Removing html question from message thread")
-                content = []  # Reset content list
-                answer_summary = summarize_answer(api_key, html_question, answer)  # Summarize the answer
-                messages.append({
-                    "role": "assistant",
-                    "content": f"{answer_summary}"
-                })
-                logger.info(f"Answer summary added to message thread")
-                element.click()  # Select the answer in the browser
-                logger.info(f"Answer selected in chrome browser")
-                time.sleep(1)
-
-            # Handle text areas (open text responses)
-            elif element in driver.find_elements(By.TAG_NAME, 'textarea'):
-                logger.info(f"Question type: textarea")
-                html_question = element.get_attribute('innerHTML')
-                logger.debug(f"HTML question: {html_question}")
-                content.append({
-                    "type": "text",
-                    "text": f"{html_question} \n\n Answer this question as if you were the respondent. Only return your answer."
-                })
-                messages.append({
-                    "role": "user",
-                    "content": content
-                })
-                logger.info(f"HTML question added to messages")
-                logger.debug(f"Messages: {messages}")
-                answer = answer_survey_other(api_key, messages)  # Get answer from OpenAI API
-                logger.info(f"Answer: {answer}")
-                messages = messages[:-1]  # Remove the question from the messages
-                logger.info(f"Removing html question from message thread")
-                content = []  # Reset content list
-                answer_summary = summarize_answer(api_key, html_question, answer)  # Summarize the answer
-                messages.append({
-                    "role": "assistant",
-                    "content": f"{answer_summary}"
-                })
-                logger.info(f"Answer summary added to message thread")
-                element.send_keys(answer)  # Enter the text response into the text area
-                logger.info(f"Answer inputted in chrome browser")
-                time.sleep(1)
+        # Add all questions of the page to a single message
+        question_list = "\n\n".join(f"Question {i}: {html_question}" for i, (_, _, html_question, _) in enumerate(questions))
+        logger.debug(f"HTML questions: {question_list}")
+        content.append({
+            "type": "text",
+            "text": f"{question_list} \n\n Answer these questions as if you were the respondent. Only return the JSON with your answers and their summaries."
+        })
+        messages.append({
+            "role": "user",
+            "content": content
+        })
+        logger.info(f"HTML questions added to messages")
+        logger.debug(f"Messages before: {messages}")
+        try:
+            answers = await answer_survey_page(messages, questions)  # Get all answers of the page from OpenAI API
+        except ValueError:
+            logger.error(f"No valid answers for page {page_index}, stopping the survey for this user")
+            return False
+        messages = messages[:-1]  # Remove the questions from the messages
+        logger.info(f"Removing html questions from message thread")
+
+        for i, (question_type, _, _, _) in enumerate(questions):
+            logger.info(f"Question type: {question_type}")
+            logger.info(f"Answer: {answers[i]['answer']}")
+            logger.info(f"Answer summary: {answers[i]['summary']}")
+            messages.append({
+                "role": "assistant",
+                "content": f"{answers[i]['summary']}"
+            })
+            logger.info(f"Answer summary added to message thread")
+
+        await asyncio.to_thread(fill_answers, driver, questions, answers)  # Fill in each answer in the browser
+
+      # Append the messages of this page to the user's log for later review
+      await asyncio.to_thread(write_message_log, log_filename, messages[page_start:])
 
-      # Save the messages to a JSON file for later review
-      with open(f'messages.json', 'w') as f:
-          json.dump(messages, f)
+      # Only keep the system message and the most recent messages to limit the prompt size
+      messages = messages[:1] + messages[1:][-MESSAGE_HISTORY_LENGTH:]
 
       # Look for and click the "Next" button to move to the next survey page
-      try:
-        next_button = WebDriverWait(driver, 10).until(
-            lambda d: d.find_element(By.ID, "next_button")
-        )
-        next_button.click()
-      except:
+      if not await asyncio.to_thread(go_to_next_page, wait):
         logger.error(f"Next button not found on page {page_index}.")  # Log an error if the button is not found
         break
-      time.sleep(1)
+      await asyncio.sleep(1)
       page_index += 1  # Increment page index
       logger.info(f"Page {page_index} completed")
 
-    return screenshots
+    return True
 
-# Loop through each row (user) in the loaded CSV data and fill the survey
-for index, row in data.iterrows():
+# Replace a browser that may be in a bad state with a fresh one
+async def replace_driver(driver: webdriver.Chrome, driver_path: str) -> webdriver.Chrome:
+    """
+    Starts a new browser and quits the given one. If the new browser cannot be started, the given one is kept
+    so the pool never shrinks.
+    """
+    try:
+        new_driver = await asyncio.to_thread(webdriver.Chrome, service=Service(driver_path), options=Options())
+    except Exception:
+        logger.exception(f"Could not start a replacement browser, reusing the current one")
+        return driver
+    try:
+        await asyncio.to_thread(driver.quit)
+    except Exception:
+        logger.warning(f"Could not quit the replaced browser")
+    return new_driver
+
+# Fill the survey for a single user (row) from the loaded CSV data
+async def fill_survey_async(index, row, drivers: asyncio.Queue, driver_path: str):
+    """
+    Takes a browser from the shared pool, fills out the survey for the given user and returns the browser to the pool.
+    If the survey fails, the error is logged and the browser is replaced so the other users are not affected.
+    """
     # Extract necessary variables from the CSV row
     age = row['Age']
     gender = row['Sex']
@@ -430,25 +486,63 @@ for index, row in data.iterrows():
     # Translate student status to text used in API messages
     student_text = "You are a student" if student_status == "Yes" else "You are not a student"
 
-    # Set up Chrome WebDriver options
-    chrome_options = Options()
-
-    # Use WebDriver Manager to ensure the latest ChromeDriver is installed and used
-    service = Service(ChromeDriverManager().install())
-
-    # Initialize Chrome WebDriver
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-
-    # Open the survey URL
-    url = 'https://sustainabilityde.sawtoothsoftware.com/'
-    driver.get(url)
-    time.sleep(3)  # Wait for the page to load
-
-    # Fill out the survey for this user
-    fill_survey(driver, age, gender, Country_origin, ethnicity, Country, student_text, work_status)
-
-    # Close the browser after completing the survey
-    driver.quit()
-    logger.info(f"Survey completed for user {index + 1}")
-    logger.info(f"Waiting 3 seconds before starting the next survey")
-    time.sleep(3)
+    driver = await drivers.get()  # Wait for a free browser
+    try:
+        # Start a fresh survey session in the reused browser
+        await asyncio.to_thread(driver.delete_all_cookies)
+
+        # Open the survey URL
+        url = 'https://sustainabilityde.sawtoothsoftware.com/'
+        await asyncio.to_thread(driver.get, url)
+        await asyncio.sleep(3)  # Wait for the page to load
+
+        # Fill out the survey for this user
+        if await fill_survey(driver, index + 1, age, gender, Country_origin, ethnicity, Country, student_text, work_status):
+            logger.info(f"Survey completed for user {index + 1}")
+        else:
+            logger.error(f"Survey stopped for user {index + 1}")
+    except Exception:
+        logger.exception(f"Survey failed for user {index + 1}")
+        driver = await replace_driver(driver, driver_path)  # The browser may be left in a bad state
+    finally:
+        drivers.put_nowait(driver)  # Return the browser to the pool for the next user
+
+# Fill the survey for every row (user) in the loaded CSV data concurrently
+async def main():
+    """
+    Runs the survey for all users in parallel, bounded by MAX_CONCURRENT_USERS browsers that are reused across users.
+    """
+    # One worker thread per browser so every browser can run its Selenium calls at the same time
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=MAX_CONCURRENT_USERS))
+
+    # Use WebDriver Manager to ensure the latest ChromeDriver is installed once and used by all browsers
+    driver_path = ChromeDriverManager().install()
+
+    drivers = asyncio.Queue()
+
+    async def start_driver():
+        """
+        Starts one browser and adds it to the pool as soon as it is up, so it is always quit in the cleanup below.
+        """
+        drivers.put_nowait(await asyncio.to_thread(webdriver.Chrome, service=Service(driver_path), options=Options()))
+
+    try:
+        # Initialize the pool of Chrome WebDrivers, starting the browsers in parallel
+        # Wait for every start to finish before re-raising a failure, so no browser is added after the cleanup
+        for result in await asyncio.gather(*(start_driver() for _ in range(min(MAX_CONCURRENT_USERS, len(data)))), return_exceptions=True):
+            if isinstance(result, BaseException):
+                raise result
+
+        tasks = [fill_survey_async(index, row, drivers, driver_path) for index, row in data.iterrows()]
+        # A failing user must not cancel the surveys of the other users
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, BaseException):
+                logger.error(f"Survey task failed: {result!r}")
+    finally:
+        # Close the browsers after completing all surveys
+        while not drivers.empty():
+            await asyncio.to_thread(drivers.get_nowait().quit)
+        for client in _clients.values():
+            await client.close()  # Close the shared aiohttp sessions
+
+asyncio.run(main())